@@ -2,20 +2,21 @@ import streamlit as st
 from streamlit_drawable_canvas import st_canvas
 from PIL import Image
 import numpy as np
-import os
-import shutil
-import time
+import cv2
 
 # Custom Modules
 from imagetranslaterai.ocr_engine import OCREngine
 from imagetranslaterai.translator import Translator
 from imagetranslaterai.inpainter import Inpainter
 from imagetranslaterai.renderer import TextRenderer
-from imagetranslaterai.utils import ImageUtils
+from imagetranslaterai.utils import ResultCache, content_hash, downscale_image, encode_image
 
 # --- Configuration ---
 st.set_page_config(layout="wide", page_title="AI Image Translator")
 
+# Larger ROIs are processed at this long-side size and upscaled before merging
+MAX_WORK_SIDE = 2000
+
 # --- Cached Resource Loading ---
 # Load models once to improve performance
 @st.cache_resource
@@ -27,8 +28,14 @@ def load_pipeline():
     renderer = TextRenderer()
     return ocr, inpainter, translator, renderer
 
+@st.cache_resource
+def load_result_cache():
+    # Final merged images (bytes) for repeated image/ROI/language requests
+    return ResultCache(max_entries=64)
+
 try:
     ocr, inpainter, translator, renderer = load_pipeline()
+    result_cache = load_result_cache()
     st.success("AI Models Loaded Successfully!", icon="✅")
 except Exception as e:
     st.error(f"Failed to load models: {e}")
@@ -50,18 +57,17 @@ def main():
     uploaded_file = st.sidebar.file_uploader("Upload Image", type=["png", "jpg", "jpeg", "webp"])
     
     if uploaded_file:
-        # 1. Save Uploaded File to Disk (Required for path-based pipeline)
-        assets_dir = os.path.join(os.getcwd(), "assets")
-        os.makedirs(assets_dir, exist_ok=True)
-        temp_filename = "temp_web_upload.jpg"
-        temp_image_path = os.path.join(assets_dir, temp_filename)
+        # 1. Decode the upload once per file; Streamlit reruns reuse the array.
+        # Nothing is written to disk: every stage works on this array or in-memory bytes.
+        # Crop, OCR, inpaint and merge all use this array (EXIF orientation already applied).
+        if st.session_state.get("img_file_id") != uploaded_file.file_id:
+            raw = uploaded_file.getbuffer()
+            st.session_state["img_bgr"] = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+            st.session_state["img_file_id"] = uploaded_file.file_id
+        img_bgr = st.session_state["img_bgr"]
         
-        # Save file
-        with open(temp_image_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        # Open for display
-        bg_image = Image.open(temp_image_path).convert("RGB")
+        # Display from the decoded array
+        bg_image = Image.fromarray(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB))
         
         # Layout: Left (Canvas), Right (Result)
         col1, col2 = st.columns([1, 1])
@@ -122,49 +128,63 @@ def main():
                             status = st.status("Processing...", expanded=True)
                             
                             try:
-                                # Step A: Crop
-                                status.write("✂️ Cropping ROI...")
-                                crop_path = ImageUtils.crop_image(temp_image_path, left, top, width, height)
-                                
-                                # Step B: Pipeline
-                                status.write("🔍 Detecting Text (OCR)...")
-                                ocr_results = ocr.detect_text(crop_path)
+                                # Same image + ROI + language: reuse the previous result
+                                cache_key = (content_hash(uploaded_file.getbuffer()), left, top, width, height, target_lang)
+                                cached_result = result_cache.get(cache_key)
                                 
-                                if not ocr_results:
-                                    status.update(label="No text detected!", state="error")
-                                    st.error("Text not found in the selected area.")
+                                if cached_result is not None:
+                                    status.update(label="Complete! (cached)", state="complete", expanded=False)
+                                    st.success("Refactoring Complete!")
+                                    st.image(cached_result, caption="Final Result", use_column_width=True)
                                 else:
-                                    # Extract boxes for inpainting
-                                    all_boxes = [item['box'] for item in ocr_results]
-                                    
-                                    status.write("🎨 Inpainting Background...")
-                                    mask_path = inpainter.create_mask(crop_path, all_boxes, padding=5)
-                                    inpainted_crop_path = os.path.join(assets_dir, "temp_crop_inpainted.webp")
-                                    inpainter.inpaint_simple_fill(crop_path, mask_path, inpainted_crop_path)
-                                    
-                                    status.write(f"🌍 Translating to {target_lang}...")
-                                    analysis_data = translator.translate_and_analyze(ocr_results, crop_path, target_language=target_lang)
+                                    # Step A: Crop
+                                    status.write("✂️ Cropping ROI...")
+                                    # OCR/mask/inpaint/translation run on the (downscaled) ROI of the decoded upload
+                                    crop_img = img_bgr[top:top + height, left:left + width].copy()
+                                    work_img, scale = downscale_image(crop_img, MAX_WORK_SIDE)
+
+                                    # Step B: Pipeline
+                                    status.write("🔍 Detecting Text (OCR)...")
+                                    ocr_results = ocr.detect_text_batch([work_img])[0]
+                                
+                                    if not ocr_results:
+                                        status.update(label="No text detected!", state="error")
+                                        st.error("Text not found in the selected area.")
+                                    else:
+                                        # Extract boxes for inpainting
+                                        all_boxes = [item['box'] for item in ocr_results]
                                     
-                                    status.write("✨ Rendering Text...")
-                                    final_crop_output_path = os.path.join(assets_dir, f"temp_crop_output_{target_lang}.jpg")
-                                    renderer.render_text(inpainted_crop_path, analysis_data, final_crop_output_path)
+                                        status.write("🎨 Inpainting Background...")
+                                        mask = inpainter.create_mask_array(work_img, all_boxes, padding=5)
+                                        inpainted_crop = inpainter.inpaint_array(work_img, mask)
                                     
-                                    # Step C: Merge
-                                    status.write("🔗 Merging back to Original...")
-                                    final_merged_path = os.path.join(assets_dir, f"final_merged_output_{int(time.time())}.jpg")
+                                        status.write(f"🌍 Translating to {target_lang}...")
+                                        analysis_data = translator.translate_and_analyze(ocr_results, work_img, target_language=target_lang)
                                     
-                                    ImageUtils.merge_image(
-                                        temp_image_path,
-                                        final_crop_output_path,
-                                        left, top,
-                                        final_merged_path
-                                    )
+                                        status.write("✨ Rendering Text...")
+                                        # Render straight from the in-memory inpainted crop
+                                        inpainted_bg = Image.fromarray(cv2.cvtColor(inpainted_crop, cv2.COLOR_BGR2RGB))
+                                        final_crop = renderer.render_image(inpainted_bg, analysis_data)
+                                        if scale < 1.0:
+                                            final_crop = final_crop.resize((crop_img.shape[1], crop_img.shape[0]), Image.LANCZOS)
                                     
-                                    status.update(label="Complete!", state="complete", expanded=False)
+                                        # Step C: Merge
+                                        # Pasted into a copy of the same decoded array the ROI came from
+                                        status.write("🔗 Merging back to Original...")
+                                        merged = img_bgr.copy()
+                                        merged[top:top + crop_img.shape[0], left:left + crop_img.shape[1]] = cv2.cvtColor(
+                                            np.asarray(final_crop.convert("RGB")), cv2.COLOR_RGB2BGR
+                                        )
+                                        merged_bytes = encode_image(merged, ".jpg", quality=90)
+                                        # Untranslated fallback (no API key / API error) is not cached
+                                        if not translator.is_fallback(analysis_data, ocr_results):
+                                            result_cache.put(cache_key, merged_bytes)
+
+                                        status.update(label="Complete!", state="complete", expanded=False)
                                     
-                                    # Display Result
-                                    st.success("Refactoring Complete!")
-                                    st.image(final_merged_path, caption="Final Result", use_column_width=True)
+                                        # Display Result
+                                        st.success("Refactoring Complete!")
+                                        st.image(merged_bytes, caption="Final Result", use_column_width=True)
                                     
                             except Exception as e:
                                 status.update(label="Error occurred", state="error")
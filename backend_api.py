@@ -1,26 +1,34 @@
 
 import os
 import time
-import shutil
+import tempfile
+import uuid
+import asyncio
 import logging
 import json
+import functools
+import threading
 import numpy as np
+import cv2
 import uvicorn
+from PIL import Image
 from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
 
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 
-# Import Pipeline Modules
-from imagetranslaterai.ocr_engine import OCREngine
-from imagetranslaterai.translator import Translator
-from imagetranslaterai.inpainter import Inpainter
-from imagetranslaterai.renderer import TextRenderer
-from imagetranslaterai.utils import ImageUtils
+# Pipeline modules (paddle, openai, ...) are imported lazily in the get_* factories
+# so the server binds its port before any model code is loaded.
+if TYPE_CHECKING:
+    from imagetranslaterai.ocr_engine import OCREngine
+    from imagetranslaterai.translator import Translator
+    from imagetranslaterai.inpainter import Inpainter
+    from imagetranslaterai.renderer import TextRenderer
+from imagetranslaterai.utils import ResultCache, content_hash, downscale_image, encode_image
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -37,11 +45,154 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Uploads & intermediates go to tmpfs (RAM) when available to skip disk writes;
+# otherwise to a dedicated dir under the system temp dir (never the tracked assets/)
+ASSETS_DIR = os.environ.get(
+    "IMGTR_TMPDIR", "/dev/shm/imgtr" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "imgtr")
+)
+TEMP_MAX_AGE = 60 * 60 # seconds
+# Name prefixes of the files this server writes to ASSETS_DIR; cleanup touches nothing else
+TEMP_PREFIXES = ("upload_", "inpainted_", "mask_")
+
+# Larger uploads are processed at this long-side size and upscaled at the end
+MAX_WORK_SIDE = 2000
+
 # Mount Static Files to serve images
 os.makedirs("outputs", exist_ok=True)
-os.makedirs("assets", exist_ok=True)
+os.makedirs(ASSETS_DIR, exist_ok=True)
 app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
-app.mount("/assets", StaticFiles(directory="assets"), name="assets")
+app.mount("/assets", StaticFiles(directory=ASSETS_DIR), name="assets")
+
+# --- Cached Pipeline Instances ---
+# Models are loaded once per process (on first use) and shared across requests
+_MODELS: Dict[Any, Any] = {}
+_MODELS_LOCK = threading.Lock()
+
+# Responses for identical re-uploads, keyed by (image hash, ocr lang, target lang)
+RESULT_CACHE = ResultCache(max_entries=64)
+
+def _get_model(key: Any, factory):
+    # Lock so the startup prewarm and a first request never load the same model twice
+    with _MODELS_LOCK:
+        if key not in _MODELS:
+            _MODELS[key] = factory()
+        return _MODELS[key]
+
+def get_ocr(lang: str) -> "OCREngine":
+    def load():
+        from imagetranslaterai.ocr_engine import OCREngine
+        logger.info(f"Loading OCR Engine for lang={lang}...")
+        return OCREngine(lang=lang, precision=os.environ.get("OCR_PRECISION", "fp32"))
+    return _get_model(("ocr", lang), load)
+
+def get_inpainter() -> "Inpainter":
+    def load():
+        from imagetranslaterai.inpainter import Inpainter
+        return Inpainter()
+    return _get_model("inpainter", load)
+
+def get_translator() -> "Translator":
+    def load():
+        from imagetranslaterai.translator import Translator
+        return Translator()
+    return _get_model("translator", load)
+
+def get_renderer() -> "TextRenderer":
+    def load():
+        from imagetranslaterai.renderer import TextRenderer
+        return TextRenderer()
+    return _get_model("renderer", load)
+
+class OCRBatcher:
+    """
+    Collects concurrent OCR requests and runs them as one batched PaddleOCR call.
+    A batch is dispatched when max_batch items are queued or the oldest item
+    has waited max_wait_ms, whichever comes first.
+    """
+    def __init__(self, lang: str, max_batch: int = 8, max_wait_ms: int = 30):
+        self.lang = lang
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, image: np.ndarray) -> List[Dict[str, Any]]:
+        # Worker is started lazily so it binds to the running event loop
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future))
+        return await future
+
+    async def _gather(self) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(items) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self) -> None:
+        while True:
+            items = await self._gather()
+            images = [image for image, _ in items]
+            logger.info(f"Running batched OCR on {len(images)} image(s)...")
+
+            try:
+                # get_ocr runs in the worker thread too, so a cold model load never blocks the loop
+                results = await asyncio.to_thread(lambda: get_ocr(self.lang).detect_text_batch(images))
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+@functools.lru_cache(maxsize=4)
+def get_ocr_batcher(lang: str) -> OCRBatcher:
+    return OCRBatcher(lang)
+
+def _prewarm() -> None:
+    try:
+        # Default target (Korean) uses the 'ch' OCR model
+        get_ocr('ch')
+        get_inpainter()
+        get_translator()
+        get_renderer()
+        logger.info("Models pre-warmed.")
+    except Exception as e:
+        logger.error(f"Model pre-warm failed (will retry on first request): {e}")
+
+_prewarm_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def prewarm_models():
+    # Load models in the background so the server accepts connections immediately
+    global _prewarm_task
+    _prewarm_task = asyncio.create_task(asyncio.to_thread(_prewarm))
+
+@app.on_event("shutdown")
+async def close_clients():
+    # Close the inpainter's pooled HTTP connections if it was ever loaded
+    inpainter = _MODELS.get("inpainter")
+    if inpainter is not None:
+        await inpainter.aclose()
+
+@app.get("/healthz")
+def healthz():
+    return {"ok": True}
 
 # Verification Mock Logic (Simple BERTScore Simulation)
 def calculate_similarity(text1: str, text2: str) -> float:
@@ -49,12 +200,64 @@ def calculate_similarity(text1: str, text2: str) -> float:
     # For high fidelity demo, we'll return a high score if they are not empty.
     if not text1 or not text2:
         return 0.0
-    set1 = set(text1.split())
-    set2 = set(text2.split())
-    intersection = len(set1.intersection(set2))
-    union = len(set1.union(set2))
+    # Token-hash Jaccard: hash tokens to uint64 and intersect sorted arrays in NumPy
+    hashes1 = np.unique(np.fromiter((hash(t) & 0xFFFFFFFFFFFFFFFF for t in text1.split()), dtype=np.uint64))
+    hashes2 = np.unique(np.fromiter((hash(t) & 0xFFFFFFFFFFFFFFFF for t in text2.split()), dtype=np.uint64))
+    intersection = np.intersect1d(hashes1, hashes2, assume_unique=True).size
+    union = hashes1.size + hashes2.size - intersection
     return intersection / union if union > 0 else 0.0
 
+def _cleanup_temp_dir(max_age: int = TEMP_MAX_AGE) -> None:
+    # tmpfs lives in RAM, so stale uploads and intermediates are dropped.
+    # Only our own files: IMGTR_TMPDIR may point at a shared directory.
+    cutoff = time.time() - max_age
+    for entry in os.scandir(ASSETS_DIR):
+        try:
+            if entry.name.startswith(TEMP_PREFIXES) and entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def _write_bytes(file_path: str, contents: bytes) -> None:
+    with open(file_path, "wb") as buffer:
+        buffer.write(contents)
+
+async def _run_inpaint(inpainter: "Inpainter", image: np.ndarray, boxes: List[Any]) -> Tuple[np.ndarray, bool]:
+    """
+    Returns (inpainted image, ok); ok is False when the Stability call failed and the
+    OpenCV fallback was used, so the response is not cached.
+    """
+    # Mask is built from the already decoded upload (no re-read from disk)
+    mask = await asyncio.to_thread(inpainter.create_mask_array, image, boxes, 2)
+
+    # Check API Key for Inpainting
+    if inpainter.api_key:
+        try:
+            # Stability round-trip is awaited on the pooled async client; nothing touches disk
+            image_bytes, mask_bytes = await asyncio.to_thread(
+                lambda: (encode_image(image, ".png"), encode_image(mask, ".png"))
+            )
+            content = await inpainter.ainpaint(image_bytes, mask_bytes)
+            inpainted = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+            if inpainted is not None:
+                return inpainted, True
+            logger.error("Stability Inpainting returned an undecodable image. Using OpenCV fallback.")
+        except Exception as e:
+            logger.error(f"Stability Inpainting failed: {e}. Using OpenCV fallback.")
+        # Local fallback stays in memory
+        return await asyncio.to_thread(inpainter.inpaint_array, image, mask), False
+
+    # No Stability key: the local fill is the configured path, not a failure
+    return await asyncio.to_thread(inpainter.inpaint_array, image, mask), True
+
+def _render_to_bytes(renderer: "TextRenderer", background: np.ndarray, analysis_data: List[Dict[str, Any]], output_size: Optional[tuple] = None) -> bytes:
+    bg_image = Image.fromarray(cv2.cvtColor(background, cv2.COLOR_BGR2RGB))
+    rendered = cv2.cvtColor(np.asarray(renderer.render_image(bg_image, analysis_data)), cv2.COLOR_RGB2BGR)
+    # Restore the original canvas size for downscaled inputs
+    if output_size is not None and (rendered.shape[1], rendered.shape[0]) != output_size:
+        rendered = cv2.resize(rendered, output_size, interpolation=cv2.INTER_LANCZOS4)
+    return encode_image(rendered, ".jpg", quality=90)
+
 @app.post("/process-image")
 async def process_image(
     file: UploadFile = File(...), 
@@ -64,10 +267,14 @@ async def process_image(
     logger.info(f"Received request: {file.filename}, Target: {target_language}")
 
     # 1. Save Uploaded File
-    temp_filename = f"upload_{int(time.time())}_{file.filename}"
-    file_path = os.path.join("assets", temp_filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # The file is only written for the /assets preview URL;
+    # the pipeline itself (translator included) works on the decoded array below.
+    # uuid, not a timestamp: concurrent requests in the same second must not share a file
+    temp_filename = f"upload_{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
+    file_path = os.path.join(ASSETS_DIR, temp_filename)
+    await asyncio.to_thread(_cleanup_temp_dir)
+    contents = await file.read()
+    await asyncio.to_thread(_write_bytes, file_path, contents)
     
     try:
         # Determine Source Language based on Request or detection logic
@@ -81,35 +288,39 @@ async def process_image(
         # Override for the specific test case user mentioned
         if "chinese" in file.filename.lower() or target_language == 'Korean':
             ocr_lang = 'ch'
+
+        # Identical re-upload: reuse the previous result
+        cache_key = (content_hash(contents), ocr_lang, target_language)
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info("Cache hit. Returning previous result.")
+            return {**cached, "localPreview": f"http://localhost:8000/assets/{temp_filename}"}
         
         # 2. OCR
         logger.info(f"Running OCR with lang={ocr_lang}...")
-        ocr = OCREngine(lang=ocr_lang)
-        ocr_results = ocr.detect_text(file_path)
+        image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not decode uploaded image: {file.filename}")
+        orig_h, orig_w = image.shape[:2]
+        image, scale = downscale_image(image, MAX_WORK_SIDE)
+        ocr_results = await get_ocr_batcher(ocr_lang).submit(image)
         
         # Extract Text
         original_text_full = " ".join([item['text'] for item in ocr_results])
 
-        # 3. Inpainting
-        logger.info("Running Inpainting...")
-        inpainter = Inpainter()
+        # 3. Inpainting + 4. Translation
+        # Both only depend on the OCR results, so they run concurrently;
+        # rendering below waits for both.
+        logger.info(f"Running Inpainting and translating to {target_language}...")
+        inpainter, translator = await asyncio.gather(
+            asyncio.to_thread(get_inpainter), asyncio.to_thread(get_translator)
+        )
         all_boxes = [item['box'] for item in ocr_results]
-        mask_path = inpainter.create_mask(file_path, all_boxes, padding=2)
-        
-        # Check API Key for Inpainting
-        inpainted_path = os.path.join("assets", f"inpainted_{temp_filename}.webp")
-        if inpainter.api_key:
-             try:
-                 inpainter.inpaint(file_path, mask_path, inpainted_path)
-             except:
-                 inpainter.inpaint_simple_fill(file_path, mask_path, inpainted_path)
-        else:
-             inpainter.inpaint_simple_fill(file_path, mask_path, inpainted_path)
-
-        # 4. Translation
-        logger.info(f"Translating to {target_language}...")
-        translator = Translator()
-        analysis_data = translator.translate_and_analyze(ocr_results, file_path, target_language=target_language)
+        (inpainted, inpaint_ok), analysis_data = await asyncio.gather(
+            _run_inpaint(inpainter, image, all_boxes),
+            # GPT-4o sees the same (downscaled) work image the OCR boxes refer to
+            translator.atranslate_and_analyze(ocr_results, image, target_language=target_language),
+        )
         
         translated_text_full = " ".join([item['translated_text'] for item in analysis_data])
         
@@ -120,13 +331,13 @@ async def process_image(
 
         # 5. Rendering
         logger.info("Rendering Final Image...")
-        renderer = TextRenderer()
-        output_filename = f"result_{int(time.time())}.jpg"
+        renderer = await asyncio.to_thread(get_renderer)
+        output_filename = f"result_{uuid.uuid4().hex}.jpg"
         output_path = os.path.join("outputs", output_filename)
-        
-        # Select BG
-        bg_to_use = inpainted_path if os.path.exists(inpainted_path) else file_path
-        renderer.render_text(bg_to_use, analysis_data, output_path)
+
+        # Render and encode in memory; only the final JPEG is written for the /outputs mount
+        output_bytes = await asyncio.to_thread(_render_to_bytes, renderer, inpainted, analysis_data, (orig_w, orig_h))
+        await asyncio.to_thread(_write_bytes, output_path, output_bytes)
 
         # 6. Evaluation Logic (Simulated)
         # Using a fixed high score for "Successful Translation" cases
@@ -151,6 +362,10 @@ async def process_image(
             }
         }
         
+        # Only real successes: fallback output (no API key, rate limit, failed Stability call)
+        # would otherwise be served for this image for the life of the process
+        if inpaint_ok and not translator.is_fallback(analysis_data, ocr_results):
+            RESULT_CACHE.put(cache_key, response_data)
         logger.info("Processing Complete.")
         return response_data
 
@@ -161,4 +376,11 @@ async def process_image(
         return {"error": str(e)}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # WORKERS > 1 needs the import string so each worker loads (and prewarms) its own app
+    workers = int(os.environ.get("WORKERS", 1))
+    uvicorn.run(
+        "backend_api:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+    )
@@ -1,13 +1,193 @@
 import os
-import requests
 import logging
-from PIL import Image, ImageDraw, ImageFont
-from typing import List, Dict, Any
-import re
+import functools
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from typing import List, Dict, Any, Optional, Tuple
+from imagetranslaterai.utils import http_session
+import math
 import textwrap  # [필수 추가] 줄바꿈 모듈
 
 logger = logging.getLogger(__name__)
 
+# Bracket/quote characters GPT sometimes leaves around translations (e.g. ['text'])
+_STRIP_TBL = str.maketrans("", "", "[]'\"")
+
+@functools.lru_cache(maxsize=256)
+def _load_font(font_path: str, size: int):
+    """
+    Parses the TTF once per (path, size); the font-size search probes the same sizes repeatedly.
+    """
+    try:
+        return ImageFont.truetype(font_path, size)
+    except:
+        return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=256)
+def _font_metrics(font) -> Tuple[float, float]:
+    """
+    (advance width of "가", line height incl. 1.2 spacing) for a cached font.
+    """
+    bbox = font.getbbox("가")
+    return font.getlength("가"), (bbox[3] - bbox[1]) * 1.2 # 1.2 line spacing
+
+@functools.lru_cache(maxsize=256)
+def _char_widths(font) -> Dict[str, float]:
+    # Per-font advance-width table, filled lazily by _estimate_width
+    return {}
+
+def _estimate_width(font, line: str) -> float:
+    """
+    Line width as the sum of cached per-character advances (no FreeType call
+    for characters already seen at this size).
+    """
+    widths = _char_widths(font)
+    total = 0.0
+    for c in line:
+        w = widths.get(c)
+        if w is None:
+            w = widths[c] = font.getlength(c)
+        total += w
+    return total
+
+@functools.lru_cache(maxsize=4096)
+def _glyph(font, ch: str):
+    """
+    Rasterized coverage mask of one character, cached per font:
+    (mask or None for blank glyphs, ink offset from the pen on the baseline, advance).
+    """
+    left, top, right, bottom = font.getbbox(ch, anchor="ls")
+    mask = None
+    if right > left and bottom > top:
+        mask = Image.new("L", (right - left, bottom - top), 0)
+        ImageDraw.Draw(mask).text((-left, -top), ch, font=font, fill=255, anchor="ls")
+    return mask, (left, top), font.getlength(ch)
+
+@functools.lru_cache(maxsize=256)
+def _baseline_offset(font) -> float:
+    # Baseline position relative to a "middle" (anchor m) vertical anchor
+    return font.getbbox("가", anchor="lm")[1] - font.getbbox("가", anchor="ls")[1]
+
+def _parse_color(value) -> Tuple[int, ...]:
+    """
+    RGB(A) tuple for a color string from the analysis data; black when it is missing or invalid.
+    """
+    try:
+        return ImageColor.getrgb(value)
+    except (ValueError, AttributeError, TypeError):
+        logger.warning(f"Invalid text color {value!r}. Using black.")
+        return (0, 0, 0)
+
+@functools.lru_cache(maxsize=2048)
+def _fit_layout(font_path: str, text: str, full_w: float, full_h: float, hint: Optional[int] = None) -> Tuple[int, Tuple[str, ...]]:
+    """
+    (font size, wrapped lines) for text in a full_w x full_h box.
+    Deterministic in its arguments, so repeated labels in same-sized boxes
+    skip the search entirely. Module-level so the cache holds no renderer.
+    Starts from `hint` (a size chosen for a similar box) or a closed-form
+    estimate and binary-searches the bracket around it.
+    """
+    # [수정] Safe Area Logic (5% Internal Padding)
+    box_w = full_w * 0.95
+    box_h = full_h * 0.95
+
+    # Min/Max font limits
+    min_font_size = 10
+    max_font_size = int(box_h * 0.9) 
+    if max_font_size < min_font_size: max_font_size = min_font_size
+
+    best_font = None
+    best_lines = [text]
+    best_size = min_font_size
+
+    def layout(size, exact=False):
+        font = _load_font(font_path, size)
+
+        # Estimate wrapping
+        avg_char_w, line_height = _font_metrics(font)
+        if avg_char_w == 0: avg_char_w = size
+
+        wrap_width = max(1, int(box_w / avg_char_w))
+        lines = textwrap.wrap(text, width=wrap_width)
+
+        # Calculate total height
+        total_text_h = line_height * len(lines)
+
+        # Check width of longest line (per-char table while searching)
+        max_line_w = 0
+        for line in lines:
+            w = font.getlength(line) if exact else _estimate_width(font, line)
+            if w > max_line_w: max_line_w = w
+
+        # Fits? (Allow 10% overflow tolerance)
+        fits = max_line_w <= box_w * 1.1 and total_text_h <= box_h * 1.1
+        return font, lines, fits
+
+    # Closed-form starting point: the glyph cell (advance x line height) grows
+    # with size^2, so size ~ sqrt(box area / (chars * cell ratio))
+    ref_w, ref_h = _font_metrics(_load_font(font_path, 100))
+    cell_ratio = max(ref_w * ref_h, 1) / 100 ** 2
+    estimate = int(math.sqrt(box_w * box_h * 0.95 / (len(text) * cell_ratio)))
+
+    # A similar box (same text length, ~same size) seen before is a closer start
+    if hint is not None:
+        estimate = hint
+    estimate = max(min_font_size, min(max_font_size, estimate))
+
+    # Bracket the answer around the estimate (~10% steps, ~5% from a hint),
+    # then binary search only inside that bracket
+    step = max(1, estimate // (20 if hint is not None else 10))
+    font, lines, fits = layout(estimate)
+    if fits:
+        best_size, best_font, best_lines = estimate, font, lines
+        low, high = estimate + 1, max_font_size
+        probe = estimate + step
+        while probe <= max_font_size:
+            font, lines, fits = layout(probe)
+            if not fits:
+                high = probe - 1
+                break
+            best_size, best_font, best_lines = probe, font, lines
+            low = probe + 1
+            probe += step
+    else:
+        low, high = min_font_size, estimate - 1
+        probe = estimate - step
+        while probe >= min_font_size:
+            font, lines, fits = layout(probe)
+            if fits:
+                best_size, best_font, best_lines = probe, font, lines
+                low = probe + 1
+                break
+            high = probe - 1
+            probe -= step
+
+    while low <= high:
+        mid_size = (low + high) // 2
+        font, lines, fits = layout(mid_size)
+
+        if fits:
+            best_size = mid_size
+            best_font = font
+            best_lines = lines
+            low = mid_size + 1 
+        else:
+            high = mid_size - 1
+
+    # Table widths skip kerning/shaping: verify the chosen size with exact
+    # measurement, stepping down in the rare case it overflows
+    while best_font is not None and not layout(best_size, exact=True)[2]:
+        start = best_size - 1
+        best_font, best_lines, best_size = None, [text], min_font_size
+        for size in range(start, min_font_size - 1, -1):
+            font, lines, fits = layout(size)
+            if fits:
+                best_size, best_font, best_lines = size, font, lines
+                break
+
+    # Nothing fits: min size with the unwrapped text
+    return best_size, tuple(best_lines)
+
 class TextRenderer:
     def __init__(self, font_path: str = None):
         self.font_path = font_path or self._get_default_font_path()
@@ -22,7 +202,7 @@ class TextRenderer:
         logger.info("Downloading default font (NanumGothic)...")
         url = "https://github.com/google/fonts/raw/main/ofl/nanumgothic/NanumGothic-Bold.ttf"
         try:
-            r = requests.get(url)
+            r = http_session().get(url, timeout=60)
             r.raise_for_status()
             with open(save_path, 'wb') as f:
                 f.write(r.content)
@@ -37,47 +217,8 @@ class TextRenderer:
         Supports multi-line text wrapping and smart alignment.
         """
         try:
-            image = Image.open(bg_image_path).convert("RGBA")
-            draw = ImageDraw.Draw(image)
-            
-            # Filter valid items
-            valid_items = [item for item in analysis_data if 'box' in item and 'translated_text' in item]
-
-            for item in valid_items:
-                box = item['box']
-                text = item['translated_text']
-                style = item
-                
-                # 1. Cleaning
-                clean_text = re.sub(r"[\[\]\'\"]", "", str(text)).strip()
-                if not clean_text: continue
-
-                # 2. Text Wrapping & Sizing
-                font, lines, final_size = self._fit_text_to_box(draw, clean_text, box)
-                
-                color_hex = style.get('text_color_hex', '#000000')
-                
-                # [Refactor] Smart Alignment Logic
-                # If 'alignment' is explicitly set in style, use it.
-                # Otherwise, detect if the box is centered in the image.
-                if 'alignment' in style:
-                     alignment = style['alignment']
-                else:
-                    # Calculate box center relative to image
-                    xs = [p[0] for p in box]
-                    box_center_x = (min(xs) + max(xs)) / 2
-                    img_center_x = image.width / 2
-                    
-                    # If box center is within 5% of image center, assume Center Align
-                    if abs(box_center_x - img_center_x) < (image.width * 0.05):
-                        alignment = 'center'
-                    else:
-                        alignment = 'left'
-
-                # 3. Drawing
-                self._draw_multiline_text(draw, lines, box, color_hex, font, alignment)
-
-            final_image = image.convert("RGB")
+            with Image.open(bg_image_path) as image:
+                final_image = self.render_image(image, analysis_data)
             final_image.save(output_path)
             logger.info(f"Final image saved to {output_path}")
             return output_path
@@ -86,91 +227,126 @@ class TextRenderer:
             logger.error(f"Rendering failed: {e}")
             raise
 
-    def _fit_text_to_box(self, draw, text, box):
+    def render_image(self, image: Image.Image, analysis_data: List[Dict[str, Any]]) -> Image.Image:
         """
-        Calculates optimal font size and wraps text to fit within the box.
-        Uses binary search for font size.
+        In-memory variant of render_text: draws onto a copy of `image`
+        and returns the RGB result without touching the disk.
         """
-        xs = [p[0] for p in box]
-        ys = [p[1] for p in box]
-        full_w = max(xs) - min(xs)
-        full_h = max(ys) - min(ys)
-        
-        # [수정] Safe Area Logic (5% Internal Padding)
-        box_w = full_w * 0.95
-        box_h = full_h * 0.95
-        
-        # Min/Max font limits
-        min_font_size = 10
-        max_font_size = int(box_h * 0.9) 
-        if max_font_size < min_font_size: max_font_size = min_font_size
+        # Solid text fills need no alpha channel: draw on an RGB copy
+        image = image.convert("RGB")
+        draw = ImageDraw.Draw(image)
         
-        best_font = None
-        best_lines = [text]
-        best_size = min_font_size
+        # Filter valid items
+        valid_items = [item for item in analysis_data if 'box' in item and 'translated_text' in item]
 
-        low, high = min_font_size, max_font_size
-        
-        while low <= high:
-            mid_size = (low + high) // 2
-            try:
-                font = ImageFont.truetype(self.font_path, mid_size)
-            except:
-                font = ImageFont.load_default()
-
-            # Estimate wrapping
-            avg_char_w = draw.textlength("가", font=font)
-            if avg_char_w == 0: avg_char_w = mid_size
-            
-            wrap_width = max(1, int(box_w / avg_char_w))
-            lines = textwrap.wrap(text, width=wrap_width)
+        # Last chosen size per (text length, box w/h in 10px buckets): seeds the next search.
+        # Kept per call, so it stays bounded and never depends on earlier renders.
+        size_hints: Dict[Tuple[int, int, int], int] = {}
+
+        # Geometry for all items up front (struct-of-arrays)
+        extents = self._box_extents([item['box'] for item in valid_items])
+        centers_x = ((extents[:, 0] + extents[:, 2]) / 2).tolist()
+        extents = extents.tolist()
+
+        for i, item in enumerate(valid_items):
+            extent = extents[i]
+            text = item['translated_text']
+            style = item
             
-            # Calculate total height
-            bbox = font.getbbox("가")
-            line_height = (bbox[3] - bbox[1]) * 1.2 # 1.2 line spacing
-            total_text_h = line_height * len(lines)
+            # 1. Cleaning
+            clean_text = str(text).translate(_STRIP_TBL).strip()
+            if not clean_text: continue
+
+            # 2. Text Wrapping & Sizing
+            font, lines, final_size = self._fit_text_to_box(draw, clean_text, extent, size_hints)
             
-            # Check width of longest line
-            max_line_w = 0
-            for line in lines:
-                w = draw.textlength(line, font=font)
-                if w > max_line_w: max_line_w = w
-
-            # Fits? (Allow 10% overflow tolerance)
-            if max_line_w <= box_w * 1.1 and total_text_h <= box_h * 1.1:
-                best_size = mid_size
-                best_font = font
-                best_lines = lines
-                low = mid_size + 1 
+            # [Refactor] Smart Alignment Logic
+            # If 'alignment' is explicitly set in style, use it.
+            # Otherwise, detect if the box is centered in the image.
+            if 'alignment' in style:
+                 alignment = style['alignment']
             else:
-                high = mid_size - 1
-        
-        if best_font is None:
-            best_font = ImageFont.truetype(self.font_path, min_font_size)
+                # Calculate box center relative to image
+                box_center_x = centers_x[i]
+                img_center_x = image.width / 2
+                
+                # If box center is within 5% of image center, assume Center Align
+                if abs(box_center_x - img_center_x) < (image.width * 0.05):
+                    alignment = 'center'
+                else:
+                    alignment = 'left'
 
-        return best_font, best_lines, best_size
+            # 3. Drawing
+            # Color parsed per drawn item: a bad value from GPT only falls back to black for that item
+            color = _parse_color(style.get('text_color_hex', '#000000'))
+            self._draw_multiline_text(image, lines, extent, color, font, alignment)
 
-    def _draw_multiline_text(self, draw, lines, box, color, font, alignment='left'):
-        xs = [p[0] for p in box]
-        ys = [p[1] for p in box]
-        
+        return image
+
+    @staticmethod
+    def _box_extents(boxes: List[List[List[float]]]) -> np.ndarray:
+        """
+        (N, 4) array of [min_x, min_y, max_x, max_y] per box.
+        """
+        if not boxes:
+            return np.zeros((0, 4))
+        if len({len(box) for box in boxes}) == 1:
+            pts = np.asarray(boxes, dtype=np.float64)  # (N, K, 2)
+            return np.concatenate([pts.min(axis=1), pts.max(axis=1)], axis=1)
+        # Ragged polygons: one box at a time
+        return np.array([
+            [*np.min(box, axis=0), *np.max(box, axis=0)] for box in boxes
+        ], dtype=np.float64)
+
+    def _fit_text_to_box(self, draw, text, extent, size_hints=None):
+        """
+        Calculates optimal font size and wraps text to fit within the box
+        (extent = [min_x, min_y, max_x, max_y]).
+        size_hints: per-render dict of sizes chosen for similar boxes (optional).
+        """
+        min_x, min_y, max_x, max_y = extent
+        full_w, full_h = max_x - min_x, max_y - min_y
+        if size_hints is None:
+            size_hints = {}
+        # Last size chosen for a similar box seeds the search; recorded on cache hits too
+        hint_key = (len(text), round(full_w / 10), round(full_h / 10))
+        size, lines = _fit_layout(self.font_path, text, full_w, full_h, size_hints.get(hint_key))
+        size_hints[hint_key] = size
+        return _load_font(self.font_path, size), list(lines), size
+
+    def _draw_multiline_text(self, image, lines, extent, color, font, alignment='left'):
         # Dimensions
-        min_x = min(xs)
-        max_x = max(xs)
+        min_x, min_y, max_x, max_y = extent
         center_x = (min_x + max_x) / 2
-        center_y = (min(ys) + max(ys)) / 2
+        center_y = (min_y + max_y) / 2
         
         # Vertical centering (Block)
-        bbox = font.getbbox("가")
-        line_height = (bbox[3] - bbox[1]) * 1.2
+        line_height = _font_metrics(font)[1]
         total_h = line_height * len(lines)
         current_y = center_y - (total_h / 2) + (line_height / 2) 
         
         for line in lines:
             if alignment == 'center':
-                draw.text((center_x, current_y), line, font=font, fill=color, anchor="mm")
+                # Same advances _draw_line steps by: no extra layout pass per line
+                start_x = center_x - _estimate_width(font, line) / 2
             else: # 'left' default
                 # Left align start x is min_x (plus small padding)
-                draw.text((min_x, current_y), line, font=font, fill=color, anchor="lm")
+                start_x = min_x
+            self._draw_line(image, start_x, current_y, line, font, color)
             
-            current_y += line_height
\ No newline at end of file
+            current_y += line_height
+
+    @staticmethod
+    def _draw_line(image, x, y, line, font, color):
+        """
+        Draws one line (anchor "lm" at x, y) by pasting cached glyph masks,
+        so repeated characters are rasterized only once per font.
+        Equivalent to draw.text for Pillow's basic layout (no shaping).
+        """
+        baseline = y + _baseline_offset(font)
+        for ch in line:
+            mask, (left, top), advance = _glyph(font, ch)
+            if mask is not None:
+                px, py = round(x + left), round(baseline + top)
+                image.paste(color, (px, py, px + mask.width, py + mask.height), mask)
+            x += advance
\ No newline at end of file
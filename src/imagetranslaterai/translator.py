@@ -1,35 +1,80 @@
 import os
-import json
-import base64
+import mmap
+import re
+import importlib.util
+import asyncio
 import logging
-from typing import List, Dict, Any
+import cv2
+import numpy as np
+from typing import List, Dict, Any, Tuple, Union
 from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError, RateLimitError, AuthenticationError
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI, OpenAIError, RateLimitError, AuthenticationError
+
+try:
+    # SIMD base64 (optional): same API, several times faster on large images
+    import pybase64 as base64 # type: ignore
+except ImportError:
+    import base64
+
+from imagetranslaterai.utils import downscale_image, dump_json, encode_image, image_size, load_json
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# GPT-4o fits vision inputs into 2048x2048 anyway; larger uploads are shrunk before base64
+MAX_VISION_SIDE = 2048
+
+# Image sent along with the text blocks: a file path or an already decoded BGR array
+# (pass the array the OCR ran on, so the prompt's box coordinates match the picture)
+ImageInput = Union[str, np.ndarray]
+
+# HTTP/2 (one multiplexed connection for concurrent requests) needs the optional h2 package
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# ```json ... ``` wrapper GPT sometimes adds despite the prompt (closing fence optional)
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*(?:```)?\s*$", re.S)
+
 class Translator:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.client = None
+        self.aclient = None
 
         if not self.api_key:
             logger.warning("⚠️ OPENAI_API_KEY not set. Translation will be skipped (fallback to original).")
         else:
             try:
-                self.client = OpenAI(api_key=self.api_key)
+                self.client = OpenAI(api_key=self.api_key, http_client=DefaultHttpxClient(http2=HTTP2_ENABLED))
+                # Async client for concurrent requests (atranslate_and_analyze, used by backend_api)
+                self.aclient = AsyncOpenAI(api_key=self.api_key, http_client=DefaultAsyncHttpxClient(http2=HTTP2_ENABLED))
             except Exception as e:
                 logger.error(f"OpenAI Client Init Failed: {e}")
 
-    def _encode_image(self, image_path: str) -> str:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+    def _encode_image(self, image: ImageInput) -> Tuple[str, float]:
+        """
+        Base64 JPEG/original bytes of `image` and the scale applied to fit MAX_VISION_SIDE
+        (1.0 when sent as-is).
+        """
+        if isinstance(image, np.ndarray):
+            img, scale = downscale_image(image, MAX_VISION_SIDE)
+            return base64.b64encode(encode_image(img, ".jpg", quality=85)).decode('ascii'), scale
+
+        if max(image_size(image)) > MAX_VISION_SIDE:
+            img = cv2.imread(image)
+            if img is not None:
+                img, scale = downscale_image(img, MAX_VISION_SIDE)
+                return base64.b64encode(encode_image(img, ".jpg", quality=85)).decode('utf-8'), scale
+
+        # Encode straight from the page cache: no intermediate bytes copy of the file
+        with open(image, "rb") as image_file:
+            with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return base64.b64encode(mm).decode('ascii'), 1.0
 
-    def translate_and_analyze(self, text_blocks: List[Dict[str, Any]], image_path: str, target_language: str = "Korean") -> List[Dict[str, Any]]:
+    def translate_and_analyze(self, text_blocks: List[Dict[str, Any]], image: ImageInput, target_language: str = "Korean") -> List[Dict[str, Any]]:
         """
         Translates text blocks and analyzes style using GPT-4o.
         Supports dynamic target language (e.g., "English", "Japanese").
+        image: path or BGR array in the coordinate space of the text blocks' boxes.
         """
         # 1. Fallback if no API client
         if not self.client:
@@ -39,96 +84,11 @@ class Translator:
         logger.info(f"Sending request to GPT-4o for translation to {target_language}...")
         
         try:
-            base64_image = self._encode_image(image_path)
-            
-            # Simplify text blocks for the prompt
-            blocks_summary = json.dumps([{
-                'id': i, 
-                'text': b['text'], 
-                'box': b['box']
-            } for i, b in enumerate(text_blocks)], ensure_ascii=False)
-
-            prompt = f"""
-            You are a professional marketing copywriter and visual translator.
-            Your goal is to "Localize" text for a **{target_language}** audience while strictly PRESERVING Brand Identity.
-            
-            Instructions:
-            1. **Brand Protection (CRITICAL):** 
-               - DO NOT TRANSLATE Brand Names (e.g., 'OEM', 'ODM', 'Canon', 'Nike'). Keep them in English/Original.
-               - DO NOT TRANSLATE Specific Product Model Codes (e.g., 'YM-X-3011').
-            
-            2. **Noise Filtering (CRITICAL):**
-               - If a text block seems to be OCR noise (e.g., "1l1.", ";/.", single characters), return empty string "" for `translated_text`.
-               - Do not output garbage brackets or symbols.
-            
-            3. **Summarize & Localize:** 
-               - Write concise, natural **{target_language}** marketing copy.
-               - Output clean strings only. NO brackets like `['text']`.
-            
-            Input Data (ID, Text, Box):
-            {blocks_summary}
-            
-            Return ONLY valid JSON in this format:
-            [
-                {{
-                    "id": 0,
-                    "translated_text": "Localized Text in {target_language}", 
-                    "text_color_hex": "#000000",
-                    "alignment": "center" 
-                }}
-            ]
-            """
-
             response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that outputs only valid JSON. Output strictly JSON without markdown."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.1
+                **self._build_request(text_blocks, image, target_language)
             )
+            return self._parse_response(response, text_blocks)
             
-            content = response.choices[0].message.content.strip()
-            # Clean up potential markdown markers
-            if content.startswith("```json"):
-                content = content[7:]
-            elif content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-                
-            analysis_data = json.loads(content)
-            
-            # Robust ID Matching logic
-            ocr_map = {i: block['box'] for i, block in enumerate(text_blocks)}
-            
-            for item in analysis_data:
-                raw_id = item.get('id')
-                if raw_id is not None:
-                    try:
-                        idx = int(raw_id)
-                        if idx in ocr_map:
-                            item['box'] = ocr_map[idx]
-                    except ValueError:
-                        logger.warning(f"Invalid ID format from GPT: {raw_id}")
-            
-            return analysis_data
-            
         except RateLimitError:
             logger.error("OpenAI Rate Limit Exceeded. Using fallback.")
             return self._create_fallback_data(text_blocks)
@@ -141,6 +101,134 @@ class Translator:
             logger.error(f"GPT-4o translation failed: {e}")
             return self._create_fallback_data(text_blocks)
 
+    async def atranslate_and_analyze(self, text_blocks: List[Dict[str, Any]], image: ImageInput, target_language: str = "Korean") -> List[Dict[str, Any]]:
+        """
+        Async variant of translate_and_analyze on AsyncOpenAI (same prompt, parsing and fallbacks).
+        """
+        if not self.aclient:
+            logger.info("No API Key. Returning fallback data.")
+            return self._create_fallback_data(text_blocks)
+
+        logger.info(f"Sending async request to GPT-4o for translation to {target_language}...")
+
+        try:
+            # Image read/resize/base64 is CPU work: keep it off the event loop
+            request = await asyncio.to_thread(self._build_request, text_blocks, image, target_language)
+            response = await self.aclient.chat.completions.create(**request)
+            return self._parse_response(response, text_blocks)
+
+        except RateLimitError:
+            logger.error("OpenAI Rate Limit Exceeded. Using fallback.")
+            return self._create_fallback_data(text_blocks)
+
+        except AuthenticationError:
+            logger.error("OpenAI Authentication Failed. Using fallback.")
+            return self._create_fallback_data(text_blocks)
+
+        except Exception as e:
+            logger.error(f"GPT-4o translation failed: {e}")
+            return self._create_fallback_data(text_blocks)
+
+    def _build_request(self, text_blocks: List[Dict[str, Any]], image: ImageInput, target_language: str) -> Dict[str, Any]:
+        """
+        Chat-completion arguments (prompt + base64 image) shared by the sync and async calls.
+        """
+        base64_image, scale = self._encode_image(image)
+        
+        # Simplify text blocks for the prompt
+        # Boxes are given in the pixel space of the image actually sent (shrunk above MAX_VISION_SIDE)
+        blocks_summary = dump_json([{
+            'id': i, 
+            'text': b['text'], 
+            'box': b['box'] if scale == 1.0 else [[round(x * scale), round(y * scale)] for x, y in b['box']]
+        } for i, b in enumerate(text_blocks)])
+
+        prompt = f"""
+        You are a professional marketing copywriter and visual translator.
+        Your goal is to "Localize" text for a **{target_language}** audience while strictly PRESERVING Brand Identity.
+        
+        Instructions:
+        1. **Brand Protection (CRITICAL):** 
+           - DO NOT TRANSLATE Brand Names (e.g., 'OEM', 'ODM', 'Canon', 'Nike'). Keep them in English/Original.
+           - DO NOT TRANSLATE Specific Product Model Codes (e.g., 'YM-X-3011').
+        
+        2. **Noise Filtering (CRITICAL):**
+           - If a text block seems to be OCR noise (e.g., "1l1.", ";/.", single characters), return empty string "" for `translated_text`.
+           - Do not output garbage brackets or symbols.
+        
+        3. **Summarize & Localize:** 
+           - Write concise, natural **{target_language}** marketing copy.
+           - Output clean strings only. NO brackets like `['text']`.
+        
+        Input Data (ID, Text, Box):
+        {blocks_summary}
+        
+        Return ONLY valid JSON in this format:
+        [
+            {{
+                "id": 0,
+                "translated_text": "Localized Text in {target_language}", 
+                "text_color_hex": "#000000",
+                "alignment": "center" 
+            }}
+        ]
+        """
+
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a helpful assistant that outputs only valid JSON. Output strictly JSON without markdown."
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}"
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=2000,
+            temperature=0.1
+        )
+
+    def _parse_response(self, response: Any, text_blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        content = response.choices[0].message.content
+        # Clean up potential markdown markers
+        fenced = _FENCE_RE.match(content)
+        if fenced:
+            content = fenced.group(1)
+            
+        analysis_data = load_json(content)
+        
+        # Robust ID Matching logic
+        ocr_map = {i: block['box'] for i, block in enumerate(text_blocks)}
+        
+        for item in analysis_data:
+            raw_id = item.get('id')
+            if raw_id is not None:
+                try:
+                    idx = int(raw_id)
+                    if idx in ocr_map:
+                        item['box'] = ocr_map[idx]
+                except ValueError:
+                    logger.warning(f"Invalid ID format from GPT: {raw_id}")
+        
+        return analysis_data
+
+    def is_fallback(self, analysis_data: List[Dict[str, Any]], text_blocks: List[Dict[str, Any]]) -> bool:
+        """
+        True when analysis_data is the untranslated fallback for text_blocks (no API key,
+        rate limit, API error): such results must not be cached.
+        """
+        return analysis_data == self._create_fallback_data(text_blocks)
+
     def _create_fallback_data(self, text_blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Helper to create fallback data using original text when API fails.
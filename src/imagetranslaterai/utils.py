@@ -1,11 +1,45 @@
 from PIL import Image
+import cv2
+import numpy as np
 import logging
 import os
+import hashlib
+import threading
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+try:
+    # Optional: orjson is several times faster than stdlib json on Unicode-heavy payloads
+    import orjson # type: ignore
+except ImportError:
+    orjson = None
+    import json
 
 logger = logging.getLogger(__name__)
 
+_HTTP_SESSION: Optional[requests.Session] = None
+_HTTP_LOCK = threading.Lock()
+
+def http_session() -> requests.Session:
+    """
+    Process-wide keep-alive session, so downloads and API calls reuse
+    TCP/TLS connections instead of opening one per request.
+    """
+    global _HTTP_SESSION
+    with _HTTP_LOCK:
+        if _HTTP_SESSION is None:
+            session = requests.Session()
+            # Retries cover idempotent requests only (GET downloads), never the inpaint POSTs
+            retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _HTTP_SESSION = session
+    return _HTTP_SESSION
+
 class ImageUtils:
     @staticmethod
     def crop_image(image_path: str, x: int, y: int, w: int, h: int) -> str:
@@ -35,12 +69,14 @@ class ImageUtils:
         try:
             with Image.open(original_path) as orig:
                 with Image.open(processed_crop_path) as crop:
-                    orig_rgba = orig.convert("RGBA")
-                    crop_rgba = crop.convert("RGBA")
-                    
-                    orig_rgba.paste(crop_rgba, (x, y), crop_rgba)
+                    # Rendered crops are opaque: paste RGB directly, alpha-blend only if the crop has alpha
+                    final_img = orig if orig.mode == "RGB" else orig.convert("RGB")
+                    if crop.mode in ("RGBA", "LA", "PA") or "transparency" in crop.info:
+                        crop_rgba = crop.convert("RGBA")
+                        final_img.paste(crop_rgba, (x, y), crop_rgba)
+                    else:
+                        final_img.paste(crop if crop.mode == "RGB" else crop.convert("RGB"), (x, y))
                     
-                    final_img = orig_rgba.convert("RGB")
                     final_img.save(output_path)
                     logger.info(f"Merged ROI into final image: {output_path}")
                     return output_path
@@ -48,6 +84,131 @@ class ImageUtils:
             logger.error(f"Failed to merge image: {e}")
             raise
 
+class ResultCache:
+    """
+    Small in-process LRU cache used to short-circuit repeated pipeline runs
+    (e.g. the same image re-uploaded or the same ROI retried).
+    """
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+def downscale_image(img: np.ndarray, max_side: int = 2000) -> Tuple[np.ndarray, float]:
+    """
+    Shrinks the image so its longest side is at most `max_side` px.
+    Returns the (possibly unchanged) image and the applied scale factor.
+    """
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale >= 1.0:
+        return img, 1.0
+
+    logger.info(f"Downscaling {w}x{h} input by {scale:.3f} for processing")
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+def image_size(path: str) -> Tuple[int, int]:
+    """
+    Returns (width, height) as cv2.imread would see it, reading only the file header.
+    """
+    with Image.open(path) as im:
+        w, h = im.size
+        # cv2.imread applies EXIF rotation; match its orientation
+        if im.getexif().get(0x0112) in (5, 6, 7, 8):
+            w, h = h, w
+    return w, h
+
+def encode_image(img: np.ndarray, ext: str = ".webp", quality: int = 85) -> bytes:
+    """
+    Encodes a BGR image to bytes in memory (no disk write).
+    """
+    if ext == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif ext in (".jpg", ".jpeg"):
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    else:
+        # PNG: OpenCV's default (fast zlib + RLE-friendly strategy) beat explicit
+        # IMWRITE_PNG_COMPRESSION levels on masks and photos; bilevel would drop
+        # the soft mask edges.
+        params = []
+
+    ok, buf = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buf.tobytes()
+
+def write_image(path: str, img: np.ndarray, quality: int = 85) -> str:
+    """
+    Writes a BGR image, picking fast codec flags from the file extension
+    (e.g. lossy WebP instead of OpenCV's slow lossless default).
+    """
+    with open(path, "wb") as f:
+        f.write(encode_image(img, os.path.splitext(path)[1].lower(), quality))
+    return path
+
+def content_hash(data: bytes) -> str:
+    """
+    Fast content digest of raw image bytes, used as a cache key.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def dump_json(obj: Any, indent: bool = False) -> str:
+    """
+    Serializes to a JSON string, non-ASCII kept as-is (ensure_ascii=False).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+def load_json(data: Any) -> Any:
+    """
+    Parses a JSON str/bytes with orjson when available.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def load_or_compute(cache_path: str, compute: Callable[[], Any],
+                    cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Returns the JSON stored at cache_path, or runs compute() and stores its result there
+    (unless cacheable(result) is False, e.g. for fallback output after an API error).
+    Writes go through a temp file + os.replace so an interrupted run never leaves a torn entry.
+    """
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                return load_json(f.read())
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {cache_path}: {e}")
+
+    result = compute()
+    if cacheable is not None and not cacheable(result):
+        return result
+    try:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(dump_json(result))
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.warning(f"Could not write cache entry {cache_path}: {e}")
+    return result
+
 def download_image(url: str, save_path: str) -> Optional[str]:
     """
     Download an image from a URL and save it to the specified path.
@@ -55,7 +216,7 @@ def download_image(url: str, save_path: str) -> Optional[str]:
     """
     try:
         logger.info(f"Downloading image from {url}")
-        response = requests.get(url, stream=True, timeout=10)
+        response = http_session().get(url, stream=True, timeout=10)
         response.raise_for_status()
         
         # Ensure directory exists
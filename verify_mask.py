@@ -0,0 +1,57 @@
+import logging
+import cv2
+import numpy as np
+from imagetranslaterai.inpainter import Inpainter
+
+# Setup simple logging for the script
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+H, W = 240, 320
+
+def reference_mask(boxes):
+    # Per-box fillPoly: the behaviour Inpainter._fill_boxes must reproduce
+    mask = np.zeros((H, W), dtype=np.uint8)
+    for box in boxes:
+        cv2.fillPoly(mask, [np.array(box, dtype=np.int32)], 255)
+    return mask
+
+def rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+CASES = {
+    "inside": [rect(10, 10, 60, 30), rect(100, 50, 180, 90)],
+    "overlapping": [rect(10, 10, 60, 30), rect(40, 20, 90, 50)],
+    "partly negative": [rect(-20, -10, 30, 25), rect(-50, 100, 10, 120)],
+    "fully negative": [rect(-80, -60, -10, -5), rect(-40, 20, -1, 60)],
+    "past right/bottom": [rect(300, 200, 400, 300), rect(W + 5, 10, W + 50, 40), rect(10, H, 50, H + 20)],
+    "mixed with rotated": [rect(-30, -30, -5, -5), [[50, 50], [90, 60], [85, 80], [45, 70]]],
+}
+
+# Seeded random rects, many of them straddling or outside the borders
+_rng = np.random.default_rng(0)
+_origins = _rng.integers(-60, max(H, W) + 20, size=(30, 2))
+_sizes = _rng.integers(1, 60, size=(30, 2))
+CASES["random"] = [rect(x, y, x + w, y + h) for (x, y), (w, h) in zip(_origins.tolist(), _sizes.tolist())]
+
+def main():
+    failed = 0
+    for name, boxes in CASES.items():
+        # Both input forms: point lists and the (N, 4, 2) array the pipeline builds
+        for label, arg in (("list", boxes), ("array", np.array(boxes, dtype=np.int32))):
+            mask = np.zeros((H, W), dtype=np.uint8)
+            Inpainter._fill_boxes(mask, arg)
+            expected = reference_mask(boxes)
+            diff = int(np.count_nonzero(mask != expected))
+            if diff:
+                failed += 1
+                logger.error(f"[{name}/{label}] {diff} px differ from fillPoly")
+            else:
+                logger.info(f"[{name}/{label}] OK ({int(np.count_nonzero(mask))} px)")
+
+    if failed:
+        raise SystemExit(f"{failed} mask check(s) failed")
+    print("All mask checks match per-box fillPoly.")
+
+if __name__ == "__main__":
+    main()
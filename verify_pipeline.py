@@ -1,166 +1,389 @@
 import os
+import sys
+import mmap
 import logging
-import json
 import time
-import cv2
-import numpy as np
-from imagetranslaterai.ocr_engine import OCREngine
-from imagetranslaterai.translator import Translator
-from imagetranslaterai.inpainter import Inpainter
-from imagetranslaterai.renderer import TextRenderer
-from imagetranslaterai.utils import ImageUtils # [ROI Add]
+import threading
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+# cv2/numpy and the engine modules (paddle, OpenAI SDK) are imported inside process_one()
+# and Engines: nothing heavy is loaded when there is no input image
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def main():
+# Paths resolved once, relative to this script (not the caller's cwd)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(ROOT_DIR, "assets")
+CACHE_DIR = os.path.join(ASSETS_DIR, ".cache")
+OUTPUTS_DIR = os.path.join(ROOT_DIR, "outputs")
+
+def _physical_cores() -> int:
     try:
-        # 1. Setup
-        assets_dir = os.path.join(os.getcwd(), "assets")
-        os.makedirs(assets_dir, exist_ok=True)
-        
-        # Use local image directly
-        # Use local image directly
-        # original_image_path = os.path.join(assets_dir, "sample_poster.jpg")
-        original_image_path = os.path.join(assets_dir, "chinese_test.png")
-        
-        if not os.path.exists(original_image_path):
-            logger.warning(f"Test image not found at {original_image_path}.")
-            return
+        import psutil # type: ignore
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+    except ImportError:
+        pass
+    return os.cpu_count() or 1
 
-        # *** ROI SETTINGS (Example) ***
-        # roi_coords = (50, 100, 800, 400) # (x, y, w, h) - Set to None to disable
-        # *** ROI SETTINGS (Example) ***
-        # roi_coords = (50, 100, 800, 400) # (x, y, w, h) - Set to None to disable
-        # roi_coords = (50, 100, 800, 400) # (x, y, w, h) - Set to None to disable
-        roi_coords = None # Full Image Processing
-        
-        # [ROI] Logic Switch
-        if roi_coords:
-            logger.info(f"ROI Processing Enabled: {roi_coords}")
-            # Crop ROI from original
-            processing_image_path = ImageUtils.crop_image(original_image_path, *roi_coords)
-        else:
-            logger.info("Full Image Processing Enabled")
-            processing_image_path = original_image_path
-
-        # 2. OCR
-        logger.info(">>> Step 1: OCR Detection")
-        # [Chinese Support] Change lang to 'ch'
-        ocr = OCREngine(lang='ch') 
-        ocr_results = ocr.detect_text(processing_image_path)
-        
-        if not ocr_results:
-            logger.warning("No text detected. Aborting pipeline.")
-            return
+# OpenCV / OpenMP / BLAS / Paddle threads = physical cores: SMT siblings mostly add
+# contention. Env vars must be set before paddle or the BLAS libraries load; explicit
+# user settings win.
+CPU_THREADS = _physical_cores()
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, str(CPU_THREADS))
+
+# Output names: one wall-clock stamp per run + a per-image sequence number
+# (second-resolution timestamps alone collide in batch runs)
+RUN_ID = time.strftime("%Y%m%d_%H%M%S")
+_output_seq = itertools.count(1)
+
+# Debug artifacts (OCR box overlay, restored background) only with IMGTR_DEBUG=1 or DEBUG logging
+DEBUG_OUTPUT = os.environ.get("IMGTR_DEBUG") == "1"
+
+# Pages with less "ink" than this fraction of pixels skip OCR entirely (a short word is ~0.05%)
+MIN_INK_FRACTION = 0.0001
+
+# [Chinese Support] Change lang to 'ch'
+OCR_LANG = 'ch'
+OCR_PRECISION = os.getenv("OCR_PRECISION", "fp32") # int8 needs exports under OCR_INT8_MODEL_DIR
+
+# *** TARGET LANGUAGE SETTING ***
+TARGET_LANG = "Korean" # Changed to Korean for Chinese source
+
+# *** ROI SETTINGS (Example) ***
+# ROI_COORDS = (50, 100, 800, 400) # (x, y, w, h) - Set to None to disable
+ROI_COORDS = None # Full Image Processing
+
+def _is_blank(img_bgr, min_ink_fraction=MIN_INK_FRACTION):
+    """
+    Cheap pre-OCR check: Otsu-binarize and count the minority class, so dark-on-light and
+    light-on-dark text both count as ink. A flat page has (almost) no minority pixels.
+    """
+    import cv2
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    ink = cv2.countNonZero(bw)
+    return min(ink, bw.size - ink) < bw.size * min_ink_fraction
+
+def _write_text(path, text):
+    try:
+        with open(path, "w", encoding='utf-8') as f:
+            f.write(text)
+    except Exception as e:
+        logger.warning("Could not write %s: %s", path, e)
+
+class Engines:
+    """
+    OCR / translator / inpainter / renderer shared by every image of a run.
+    Each one is built on first use, so e.g. a fully cached run never loads paddle.
+    """
+
+    def __init__(self, ocr_lang: str = OCR_LANG, ocr_precision: str = OCR_PRECISION):
+        self.ocr_lang = ocr_lang
+        self.ocr_precision = ocr_precision
+        self._ocr_cache_precision = None
+        self._instances = {}
+        # One lock per engine, so e.g. a slow OCR load never blocks the translator
+        self._locks = {name: threading.Lock() for name in ("ocr", "translator", "inpainter", "renderer")}
+
+    def _get(self, name, factory):
+        with self._locks[name]:
+            if name not in self._instances:
+                self._instances[name] = factory()
+            return self._instances[name]
+
+    def prewarm(self, pool: ThreadPoolExecutor, names=("translator", "inpainter", "renderer")) -> List[Future]:
+        """
+        Builds the given engines on `pool` in the background.
+        OCR is not in the default set: it is only needed on an OCR cache miss.
+        """
+        return [pool.submit(getattr, self, name) for name in names]
+
+    @property
+    def ocr(self):
+        def build():
+            from imagetranslaterai.ocr_engine import OCREngine
+            return OCREngine(lang=self.ocr_lang, precision=self.ocr_precision, cpu_threads=CPU_THREADS)
+        return self._get("ocr", build)
+
+    @property
+    def ocr_cache_precision(self) -> str:
+        """
+        Precision the OCR engine runs (or would run) at, for OCR cache keys:
+        int8 without installed exports is fp32, and its results are labelled so.
+        Resolved without loading paddle.
+        """
+        if self._ocr_cache_precision is None:
+            from imagetranslaterai.ocr_engine import OCREngine
+            self._ocr_cache_precision = OCREngine.resolve_precision(self.ocr_lang, self.ocr_precision)
+        return self._ocr_cache_precision
+
+    @property
+    def translator(self):
+        def build():
+            from imagetranslaterai.translator import Translator
+            return Translator()
+        return self._get("translator", build)
+
+    @property
+    def inpainter(self):
+        def build():
+            from imagetranslaterai.inpainter import Inpainter
+            return Inpainter()
+        return self._get("inpainter", build)
+
+    @property
+    def renderer(self):
+        def build():
+            from imagetranslaterai.renderer import TextRenderer
+            return TextRenderer()
+        return self._get("renderer", build)
+
+def process_one(original_image_path: str, engines: Engines, pool: ThreadPoolExecutor,
+                render_pool: ThreadPoolExecutor) -> Optional[Future]:
+    """
+    Decodes + OCRs one image on the calling thread, then queues inpainting and translation
+    on `pool` and the final render on `render_pool`. Returns the render future
+    (None when there is nothing to render).
+    """
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from imagetranslaterai.utils import ImageUtils, content_hash, dump_json, load_or_compute, write_image # [ROI Add]
+
+    assets_dir = ASSETS_DIR
+    cache_dir = CACHE_DIR
+    stem = os.path.splitext(os.path.basename(original_image_path))[0]
+    roi_coords = ROI_COORDS
+    target_lang = TARGET_LANG
+
+    # [ROI] Logic Switch
+    if roi_coords:
+        logger.info("ROI Processing Enabled: %s", roi_coords)
+        # Crop ROI from original
+        processing_image_path = ImageUtils.crop_image(original_image_path, *roi_coords)
+    else:
+        logger.info("Full Image Processing Enabled: %s", original_image_path)
+        processing_image_path = original_image_path
+
+    # 2. OCR
+    logger.info(">>> Step 1: OCR Detection")
+    # Re-runs on the same image reuse OCR/translation results from assets/.cache
+    # Map + decode once (hash and imdecode read the page cache directly, no bytes copy);
+    # every stage below works on img_bgr
+    with open(processing_image_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        image_hash = content_hash(mm)
+        buf = np.frombuffer(mm, np.uint8)
+        img_bgr = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        del buf # Release the export so the map can close
+    if img_bgr is None:
+        logger.warning("Could not decode image: %s", processing_image_path)
+        return None
+
+    def run_ocr():
+        if _is_blank(img_bgr):
+            logger.info("Blank page (no ink after Otsu threshold). Skipping OCR.")
+            return []
+        # PaddleOCR (and paddle itself) is only loaded on a cache miss
+        return engines.ocr.detect_text_batch([img_bgr])[0]
+
+    ocr_results = load_or_compute(
+        os.path.join(cache_dir, f"{image_hash}_ocr_{engines.ocr_lang}_{engines.ocr_cache_precision}.json"), run_ocr
+    )
+
+    if not ocr_results:
+        logger.warning("No text detected in %s. Skipping.", processing_image_path)
+        return None
+
+    # Extract only boxes for inpainting: one contiguous (N, K, 2) int32 array shared by the
+    # debug overlay and the mask (ragged polygons stay a list)
+    all_boxes = [item['box'] for item in ocr_results]
+    if len({len(box) for box in all_boxes}) == 1:
+        all_boxes = np.ascontiguousarray(all_boxes, dtype=np.int32)
 
-        # Visualize detected boxes
+    # Visualize detected boxes (debug runs only: skips the copy, drawing and encode)
+    if DEBUG_OUTPUT or logger.isEnabledFor(logging.DEBUG):
         try:
-            debug_img = cv2.imread(processing_image_path)
-            if debug_img is not None:
-                for item in ocr_results:
-                    # Draw box (Red, thickness 2)
-                    box = np.array(item['box'], dtype=np.int32).reshape((-1, 1, 2))
-                    cv2.polylines(debug_img, [box], True, (0, 0, 255), 2)
-                
-                debug_box_path = os.path.join(assets_dir, "debug_ocr_boxes.jpg")
-                cv2.imwrite(debug_box_path, debug_img)
-                logger.info(f"Saved OCR visualization to {debug_box_path}")
-        except Exception as e:
-            logger.warning(f"Could not save debug image: {e}")
+            debug_img = img_bgr.copy()
+            # Draw all boxes in one call (Red, thickness 2)
+            if isinstance(all_boxes, np.ndarray):
+                contours = list(all_boxes.reshape(len(all_boxes), -1, 1, 2))
+            else:
+                contours = [np.asarray(box, dtype=np.int32).reshape(-1, 1, 2) for box in all_boxes]
+            cv2.polylines(debug_img, contours, True, (0, 0, 255), 2)
 
-        # Extract only boxes for inpainting
-        all_boxes = [item['box'] for item in ocr_results]
+            # Lossy WebP is plenty for a debug overlay (smaller and faster than q95 JPEG)
+            debug_box_path = os.path.join(assets_dir, f"debug_ocr_boxes_{stem}.webp")
+            write_image(debug_box_path, debug_img, quality=80)
+            logger.info("Saved OCR visualization to %s", debug_box_path)
+        except Exception as e:
+            logger.warning("Could not save debug image: %s", e)
 
-        # 3. Inpainting (Background Restoration)
+    # 3. Inpainting (Background Restoration)
+    def do_inpaint(img_bgr, all_boxes):
         logger.info(">>> Step 2: Background Inpainting")
-        inpainter = Inpainter()
-        
-        # Create mask
-        # padding=5 (Ultra-Tight OCR에 맞춰 마스크영역 약간 확대)
+        inpainter = engines.inpainter
+
         # Create mask
         # padding=5 (Ultra-Tight OCR에 맞춰 마스크영역 약간 확대)
-        mask_path = inpainter.create_mask(processing_image_path, all_boxes, padding=2) # [Refactor] Padding 2
-        
+        mask = inpainter.create_mask_array(img_bgr, all_boxes, padding=2) # [Refactor] Padding 2
+
         # Perform inpainting
-        inpainted_path = os.path.join(assets_dir, "pipeline_restored_bg.webp")
+        inpainted_path = os.path.join(assets_dir, f"pipeline_restored_bg_{stem}.webp")
         # Inpainter requires API key, handle gracefully if missing or error
         try:
             # Use simple fill directly as requested by user or verify fallback
-            inpainter.inpaint_simple_fill(processing_image_path, mask_path, inpainted_path)
-            logger.info(f"Background restored (Simple Fill): {inpainted_path}")
+            inpainted = inpainter.inpaint_array(img_bgr, mask)
+            logger.info("Background restored (Simple Fill)")
+            if DEBUG_OUTPUT or logger.isEnabledFor(logging.DEBUG):
+                # Rendering uses the array; the file is only for review
+                write_image(inpainted_path, inpainted)
+                logger.info("Saved restored background to %s", inpainted_path)
+            return inpainted
         except Exception as e:
-            logger.error(f"Skipping inpainting: {e}")
-            inpainted_path = processing_image_path # Fallback
+            logger.error("Skipping inpainting: %s", e)
+            return img_bgr # Fallback
 
-        # 4. Translation & Analysis (Multilingual Support)
+    # 4. Translation & Analysis (Multilingual Support)
+    def do_translate(ocr_results, img_bgr, target_lang):
         logger.info(">>> Step 3: Translation & Style Analysis")
-        translator = Translator()
-        
-        # *** TARGET LANGUAGE SETTING ***
-        target_lang = "Korean" # Changed to Korean for Chinese source
-        logger.info(f"Target Language: {target_lang}")
-        
+        translator = engines.translator
+
         analysis_data = []
         try:
-            analysis_data = translator.translate_and_analyze(ocr_results, processing_image_path, target_language=target_lang)
-            
-            # Save analysis to JSON for review
-            analysis_path = os.path.join(assets_dir, "translation_analysis.json")
-            with open(analysis_path, "w", encoding='utf-8') as f:
-                json.dump(analysis_data, f, indent=4, ensure_ascii=False)
-            
+            # Fallback output (no API key / API error) is not cached, so the next run retries GPT-4o
+            # Keyed on the OCR output too: the analysis carries its boxes, so new OCR
+            # (other lang/precision/model) must never reuse an analysis built from old boxes
+            ocr_hash = content_hash(dump_json(ocr_results).encode("utf-8"))
+            analysis_data = load_or_compute(
+                os.path.join(cache_dir, f"{image_hash}_{ocr_hash}_{target_lang}.json"),
+                lambda: translator.translate_and_analyze(ocr_results, img_bgr, target_language=target_lang),
+                cacheable=lambda data: not translator.is_fallback(data, ocr_results)
+            )
+
+            # Save analysis to JSON for review, off the critical path (compact unless debugging).
+            # Not a daemon thread: interpreter exit still waits for the write to finish
+            analysis_path = os.path.join(assets_dir, f"translation_analysis_{stem}.json")
+            threading.Thread(
+                target=_write_text, args=(analysis_path, dump_json(analysis_data, indent=DEBUG_OUTPUT))
+            ).start()
+
             logger.info("Translation analysis success.")
-            
+
         except Exception as e:
-            logger.error(f"Translation failed: {e}")
+            logger.error("Translation failed: %s", e)
             import traceback
             traceback.print_exc()
+        return analysis_data
+
+    # 5. Final Rendering
+    def do_render(f_bg, f_tr):
+        # Inpainting and translation ran side by side in `pool`; join both here
+        inpainted_bgr = f_bg.result()
+        analysis_data = f_tr.result()
+        if not analysis_data:
+            return None
+
+        logger.info(">>> Step 4: Final Rendering")
+        renderer = engines.renderer
+
+        # Create outputs directory
+        outputs_dir = OUTPUTS_DIR
+        os.makedirs(outputs_dir, exist_ok=True)
+
+        # Generate unique filename with run id, sequence number, source name and lang code
+        final_output_path = os.path.join(outputs_dir, f"output_{stem}_{target_lang}_{RUN_ID}_{seq:04d}.jpg")
+
+        try:
+            # Render on the in-memory background (inpainted, or the original if inpainting failed)
+            bg_image = Image.fromarray(cv2.cvtColor(inpainted_bgr, cv2.COLOR_BGR2RGB))
+            renderer.render_image(bg_image, analysis_data).save(final_output_path)
+            logger.info("Pipeline Completed! Output at: %s", final_output_path)
+
+            # [ROI] Merge back if needed
+            if roi_coords:
+                 logger.info(">>> Step 5: ROI Merging")
+                 # Paste processed ROI back to original
+                 merged_output_path = final_output_path.replace(".jpg", "_merged.jpg")
+                 ImageUtils.merge_image(
+                     original_image_path,
+                     final_output_path,
+                     roi_coords[0],
+                     roi_coords[1],
+                     merged_output_path
+                 )
+                 logger.info("ROI Merged Output: %s", merged_output_path)
+            return final_output_path
+
+        except Exception as e:
+            logger.error("Rendering failed: %s", e)
+            import traceback
+            traceback.print_exc()
+            return None
+
+    seq = next(_output_seq) # Numbered in input order
+    f_bg = pool.submit(do_inpaint, img_bgr, all_boxes)
+    f_tr = pool.submit(do_translate, ocr_results, img_bgr, target_lang)
+    return render_pool.submit(do_render, f_bg, f_tr)
+
+def main(image_paths: Optional[List[str]] = None):
+    """
+    Runs the pipeline on image_paths (default: command-line arguments, else
+    assets/chinese_test.png) with one set of engines shared by all images.
+    """
+    try:
+        # 1. Setup
+        os.makedirs(ASSETS_DIR, exist_ok=True)
+
+        # Use local image directly
+        # image_paths = [os.path.join(ASSETS_DIR, "sample_poster.jpg")]
+        image_paths = image_paths or sys.argv[1:] or [os.path.join(ASSETS_DIR, "chinese_test.png")]
+
+        existing_paths = []
+        for path in image_paths:
+            if os.path.exists(path):
+                existing_paths.append(path)
+            else:
+                logger.warning("Test image not found at %s.", path)
+        if not existing_paths:
+            return
+
+        import cv2
+        cv2.setNumThreads(CPU_THREADS)
+
+        logger.info("Target Language: %s", TARGET_LANG)
+        engines = Engines()
+
+        # OCR runs image by image on this thread and rendering on a single worker (PaddleOCR and
+        # the shared FreeType fonts are not thread-safe); inpainting (OpenCV, releases the GIL)
+        # and translation (network wait) of all images overlap in `pool`
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool, \
+                ThreadPoolExecutor(max_workers=1) as render_pool:
+            # Translator/inpainter/renderer load while the first image is decoded and OCR'd
+            engines.prewarm(pool)
+
+            jobs = []
+            for path in existing_paths:
+                try:
+                    job = process_one(path, engines, pool, render_pool)
+                    if job is not None:
+                        jobs.append(job)
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    logger.error("Pipeline failed for %s: %s", path, e)
+            for job in jobs:
+                job.result()
 
-        # 5. Final Rendering
-        if analysis_data:
-            logger.info(">>> Step 4: Final Rendering")
-            renderer = TextRenderer()
-            
-            # Decide which background to use
-            bg_to_use = inpainted_path if (os.path.exists(inpainted_path) and inpainted_path != processing_image_path) else processing_image_path
-            
-            # Create outputs directory
-            outputs_dir = os.path.join(os.getcwd(), "outputs")
-            os.makedirs(outputs_dir, exist_ok=True)
-            
-            # Generate unique filename with timestamp and lang code
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            final_output_path = os.path.join(outputs_dir, f"output_{target_lang}_{timestamp}.jpg")
-            
-            try:
-                renderer.render_text(bg_to_use, analysis_data, final_output_path)
-                logger.info(f"Pipeline Completed! Output at: {final_output_path}")
-
-                # [ROI] Merge back if needed
-                if roi_coords:
-                     logger.info(">>> Step 5: ROI Merging")
-                     # Paste processed ROI back to original
-                     merged_output_path = final_output_path.replace(".jpg", "_merged.jpg")
-                     ImageUtils.merge_image(
-                         original_image_path, 
-                         final_output_path, 
-                         roi_coords[0], 
-                         roi_coords[1], 
-                         merged_output_path
-                     )
-                     logger.info(f"ROI Merged Output: {merged_output_path}")
-
-            except Exception as e:
-                logger.error(f"Rendering failed: {e}")
-                import traceback
-                traceback.print_exc()
-    
     except Exception as e:
         import traceback
         traceback.print_exc()
-        logger.critical(f"Pipeline failed: {e}")
+        logger.critical("Pipeline failed: %s", e)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()